@@ -1,23 +1,27 @@
 
 # Unified AI Content Generator (Interactive Streamlit Layout)
 
+import hashlib
+import io
+from collections import OrderedDict
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 import re
 import html
+import functools
+import threading
+import types
 import warnings
 import requests #type: ignore
+from requests.adapters import HTTPAdapter, Retry  # type: ignore
 import streamlit as st  # type: ignore
 
-# Document reading
-from PyPDF2 import PdfReader  # type: ignore
-from docx import Document as DocxDocument  # type: ignore
-from pptx import Presentation  # type: ignore
-
-# HANA + LangChain + Azure clients
-from hdbcli import dbapi  # type: ignore
-from langchain_community.vectorstores.hanavector import HanaDB  # type: ignore
-from langchain_openai import AzureOpenAIEmbeddings  # type: ignore
-from openai import AzureOpenAI  # type: ignore
+# Document readers (PyMuPDF/PyPDF2/python-docx/python-pptx) and the
+# HANA/LangChain/Azure clients are imported lazily inside the functions that
+# need them: together they add ~1-2 s to cold start and to every rerun's
+# import cost, and most reruns touch none of them. sys.modules caching means
+# only the first call pays.
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
@@ -26,6 +30,15 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 PERPLEXITY_API_KEY = st.secrets.get("perplexity", {}).get("api_key", "")
 PERPLEXITY_API_URL = st.secrets.get("perplexity", {}).get("api_url", "https://api.perplexity.ai/search")
 
+# Shared HTTP session: keep-alive avoids a TCP/TLS handshake per request,
+# and retries handle transient 429/5xx responses with exponential backoff.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
 
 def perplexity_search(query, max_results=5):
     """Fetch results from Perplexity.ai"""
@@ -37,7 +50,7 @@ def perplexity_search(query, max_results=5):
         "Content-Type": "application/json",
     }
     try:
-        response = requests.post(PERPLEXITY_API_URL, json=payload, headers=headers, timeout=15)
+        response = _SESSION.post(PERPLEXITY_API_URL, json=payload, headers=headers, timeout=15)
         response.raise_for_status()
         data = response.json()
         results = []
@@ -52,39 +65,162 @@ def perplexity_search(query, max_results=5):
         return f"Perplexity API Error: {e}"
 
 
+# Input splitters, compiled once: URLs may be separated by commas, newlines
+# or stray whitespace; keywords can contain spaces, so they only split on
+# commas/newlines.
+_URL_SPLIT = re.compile(r"[,\s]+")
+_KEYWORD_SPLIT = re.compile(r"[,\n]+")
+
+# Conditional-GET cache for the direct URL fallback: url -> (etag,
+# last_modified, body). On a 304 Not Modified we reuse the cached body, so
+# repeat reruns with the same reference URLs cost one header-only round-trip.
+# Bounded LRU shared by all sessions; fetches run on pool threads, so access
+# goes through the locked helpers below.
+_URL_CACHE = OrderedDict()
+_URL_CACHE_MAX = 64
+_URL_CACHE_LOCK = threading.Lock()
+
+
+def _url_cache_get(url):
+    with _URL_CACHE_LOCK:
+        entry = _URL_CACHE.get(url)
+        if entry is not None:
+            _URL_CACHE.move_to_end(url)
+        return entry
+
+
+def _url_cache_put(url, entry):
+    with _URL_CACHE_LOCK:
+        _URL_CACHE[url] = entry
+        _URL_CACHE.move_to_end(url)
+        while len(_URL_CACHE) > _URL_CACHE_MAX:
+            _URL_CACHE.popitem(last=False)
+
+
+# Upload guard rails: parsing an arbitrarily large file can OOM the worker,
+# so oversize PDFs are truncated to their first pages and other oversize
+# uploads are skipped.
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+MAX_PDF_PAGES = 50
+
+
 # File / URL text extraction
 
-def extract_text_from_file(file):
-    """Extract text from TXT / PDF / DOCX / PPTX uploads"""
-    text = ""
-    name = file.name.lower()
+def _ocr_pdf(data):
+    """OCR fallback for scanned PDFs (needs pytesseract + Pillow installed)"""
+    try:
+        import fitz  # PyMuPDF  # type: ignore
+        import pytesseract  # type: ignore
+        from PIL import Image  # type: ignore
+    except ImportError:
+        return ""
+    parts = []
+    try:
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            for page in pdf:
+                pix = page.get_pixmap(dpi=150)
+                img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                parts.append(pytesseract.image_to_string(img))
+    except Exception:
+        pass
+    return "\n".join(parts)
+
 
+def _iter_pdf_text(data, max_pages=None):
+    """Stream PDF text page by page so only one page is resident during
+    parsing. Two-tier: cheap text-layer extraction first, OCR only when the
+    text layer comes back (near) empty, i.e. a scanned PDF"""
+    chars = 0
     try:
-        if name.endswith(".txt"):
-            text = file.read().decode("utf-8", errors="ignore")
-
-        elif name.endswith(".pdf"):
-            pdf = PdfReader(file)
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-
-        elif name.endswith(".docx"):
-            doc = DocxDocument(file)
-            text = "\n".join([p.text for p in doc.paragraphs])
-
-        elif name.endswith(".pptx"):
-            ppt = Presentation(file)
-            for slide in ppt.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text += shape.text + "\n"
+        import fitz  # PyMuPDF  # type: ignore
+
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            for i, page in enumerate(pdf):
+                if max_pages is not None and i >= max_pages:
+                    break
+                page_text = page.get_text()
+                chars += len(page_text.strip())
+                yield page_text
+    except Exception:
+        # fallback for PDFs PyMuPDF refuses (e.g. encrypted)
+        try:
+            from PyPDF2 import PdfReader  # type: ignore
+
+            pdf = PdfReader(io.BytesIO(data))
+            for page in pdf.pages[:max_pages]:
+                page_text = page.extract_text() or ""
+                chars += len(page_text.strip())
+                yield page_text
+        except Exception:
+            pass
+    if chars < 50:
+        yield _ocr_pdf(data)
+
+
+def _iter_file_text(name, data):
+    """Yield text piecewise (per page / paragraph / slide shape) instead of
+    accumulating the whole document in one buffer while parsing"""
+    name = name.lower()
+
+    # oversize non-PDFs are skipped outright (PDFs get page-truncated above)
+    if len(data) > MAX_UPLOAD_BYTES and not name.endswith(".pdf"):
+        return
+
+    if name.endswith(".txt"):
+        yield data.decode("utf-8", errors="ignore")
+
+    elif name.endswith(".pdf"):
+        max_pages = MAX_PDF_PAGES if len(data) > MAX_UPLOAD_BYTES else None
+        yield from _iter_pdf_text(data, max_pages=max_pages)
+
+    elif name.endswith(".docx"):
+        from docx import Document as DocxDocument  # type: ignore
+
+        doc = DocxDocument(io.BytesIO(data))
+        for p in doc.paragraphs:
+            yield p.text
+
+    elif name.endswith(".pptx"):
+        from pptx import Presentation  # type: ignore
+
+        ppt = Presentation(io.BytesIO(data))
+        shapes = chain.from_iterable(slide.shapes for slide in ppt.slides)
+        # getattr with a default: one attribute lookup instead of hasattr + access
+        yield from (t for t in (getattr(sh, "text", "") for sh in shapes) if t)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _extract_text(name, data):
+    """Parse raw file bytes; cached on content so Streamlit reruns skip re-parsing"""
+    try:
+        text = "\n".join(_iter_file_text(name, data))
     except Exception:
         # best-effort extraction; avoid breaking generation flow
-        pass
+        text = ""
 
     return text.strip()
 
 
+def extract_text_from_file(file):
+    """Extract text from TXT / PDF / DOCX / PPTX uploads"""
+    return _extract_text(file.name, file.getvalue())
+
+
+def _html_to_text(html_doc):
+    """Reduce raw HTML to readable article text so the LLM prompt isn't fed
+    markup (tags easily inflate token count 5-10x)"""
+    try:
+        from selectolax.parser import HTMLParser  # type: ignore
+    except ImportError:
+        # crude fallback: drop scripts/styles, then strip remaining tags
+        stripped = re.sub(r"(?is)<(script|style).*?</\1>", " ", html_doc)
+        return re.sub(r"(?s)<[^>]+>", " ", stripped).strip()
+    tree = HTMLParser(html_doc)
+    tree.strip_tags(["script", "style"])
+    node = tree.css_first("article,main,body")
+    return node.text(separator="\n").strip() if node else ""
+
+
 def extract_text_from_url(url):
     """Fetch and extract readable text from a given URL using Perplexity (fallback)"""
     if not url or not url.strip():
@@ -96,7 +232,7 @@ def extract_text_from_url(url):
                 "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
                 "Content-Type": "application/json",
             }
-            response = requests.post(PERPLEXITY_API_URL, json=payload, headers=headers, timeout=20)
+            response = _SESSION.post(PERPLEXITY_API_URL, json=payload, headers=headers, timeout=20)
             response.raise_for_status()
             data = response.json()
             if "answer" in data:
@@ -104,9 +240,21 @@ def extract_text_from_url(url):
             elif "data" in data and isinstance(data["data"], list):
                 return "\n".join([d.get("text", "") for d in data["data"]])
         # fallback: simple HTTP GET (less reliable for clean article text)
-        r = requests.get(url, timeout=10)
+        get_headers = {}
+        cached = _url_cache_get(url)
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                get_headers["If-None-Match"] = etag
+            if last_modified:
+                get_headers["If-Modified-Since"] = last_modified
+        r = _SESSION.get(url, timeout=10, headers=get_headers)
+        if r.status_code == 304 and cached:
+            return cached[2]
         if r.ok:
-            return r.text
+            body = _html_to_text(r.text)
+            _url_cache_put(url, (r.headers.get("ETag"), r.headers.get("Last-Modified"), body))
+            return body
     except Exception as e:
         return f"Error extracting URL content: {e}"
     return ""
@@ -115,6 +263,31 @@ def extract_text_from_url(url):
 import streamlit as st
 import markdown
 
+# One Markdown converter per process: the costly extension/pattern registry
+# setup runs once at import; reruns just reset and reuse the instance.
+# python-markdown instances are not thread-safe and Streamlit runs each
+# session's script on its own thread, so access is serialized with a lock.
+_MD = markdown.Markdown(extensions=["extra", "sane_lists"])
+_MD_LOCK = threading.Lock()
+
+
+def _convert_md(text):
+    """Convert markdown to HTML via the shared (locked) converter; uncached"""
+    with _MD_LOCK:
+        return _MD.reset().convert(text)
+
+# Strips the ```markdown / ``` fences the model sometimes wraps around its
+# output in one C-level pass instead of chained str.replace calls
+_FENCE_RE = re.compile(r"```(?:markdown)?\n?")
+
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def _render_md(text):
+    """Normalize away fenced-code wrappers and convert markdown to HTML;
+    cached on the raw LLM output so unrelated reruns skip the parse"""
+    clean = _FENCE_RE.sub("", text).lstrip()
+    return _convert_md(clean)
+
 # ======================================================
 # Streamlit UI Setup
 # ======================================================
@@ -168,17 +341,33 @@ else:
     time_limit = st.sidebar.slider("⏱️ Video Duration (minutes)", 0.5, 10.0, 1.5, step=0.5)
     word_limit = None
 
-cta_options = [
-    "Talk to our experts", "Learn more about our solutions", "Book a free consultation",
-    "Book Assessment", "Contact us today", "Download the full guide", "Request a demo",
-]
-cta_choice = st.sidebar.selectbox("📢 Call-to-Action (CTA)", cta_options)
+# CTA options and their expanded texts. The frozen mapping's keys drive the
+# selectbox, so the chosen value is always a valid key and the handler can
+# index directly instead of falling back through .get.
+CTA_MAPPING = types.MappingProxyType({
+    "Talk to our experts": "Talk to our experts to discuss your requirements.",
+    "Learn more about our solutions": "Learn more about our solutions tailored to your needs.",
+    "Book a free consultation": "Book your free consultation today.",
+    "Book Assessment": "Book your free SAP Clean Core Assessment today.",
+    "Contact us today": "Contact us today to get started.",
+    "Download the full guide": "Download the full guide to explore more insights.",
+    "Request a demo": "Request a demo to see the solution in action.",
+})
+CTA_CHOICES = tuple(CTA_MAPPING.keys())
+
+cta_choice = st.sidebar.selectbox("📢 Call-to-Action (CTA)", CTA_CHOICES)
 
 # ======================================================
 # Custom Dynamic HTML Header
 # ======================================================
 
-st.markdown(f"""
+@st.cache_data(show_spinner=False)
+def _header_html(title):
+    """Assemble the header CSS + markup once per title; reruns reuse the
+    cached string instead of re-formatting the whole block"""
+    return f"""
+<link rel="preconnect" href="https://em-content.zobj.net" crossorigin>
+
 <style>
 .block-container {{
     padding-top: 0rem !important;
@@ -211,13 +400,16 @@ st.markdown(f"""
 
 <div class="custom-title-container">
     <img src="https://em-content.zobj.net/source/microsoft-teams/363/brain_1f9e0.png" class="custom-title-icon">
-    <div class="custom-title-text">{dynamic_title}</div>
+    <div class="custom-title-text">{title}</div>
 </div>
 
 <div class="custom-subtitle">
     AI-powered content creation for all your marketing needs
 </div>
-""", unsafe_allow_html=True)
+"""
+
+
+st.markdown(_header_html(dynamic_title), unsafe_allow_html=True)
 
 # Streamlit Title (Dynamic Too)
 st.title(f"🧠 {dynamic_title}")
@@ -262,7 +454,7 @@ with col2:
         height=70,
         label_visibility="collapsed"
     )
-    url_list = [url.strip() for url in reference_urls.split(",") if url.strip()]
+    url_list = [u for u in _URL_SPLIT.split(reference_urls.strip()) if u]
 
 #st.subheader("💬 Prompt / Inputs")
 query = st.text_input("**Enter your topic:**")
@@ -275,167 +467,263 @@ query = st.text_input("**Enter your topic:**")
 left, right = st.columns([1, 2])
 
 with left:
-    
-
-    # SEO settings for blog
-    if content_type == "Blog":
-        st.subheader("🔎 SEO Settings")
-        primary_keyword = st.text_input("Primary Keyword")
-        lsi_keywords_input = st.text_input("LSI / Variations (comma-separated)")
-        lsi_keywords = [k.strip() for k in lsi_keywords_input.split(",") if k.strip()]
-    else:
-        primary_keyword = ""
-        lsi_keywords = []
 
-    #st.markdown("<hr style='margin:0; border:0.5px solid #e0e0e0;'>", unsafe_allow_html=True)
 
-    # Generate Button
-    generate_button = st.button(f"Generate {content_type}")
-
-    # Refinement Section
-    st.markdown("**Refine / Edit generated output**")
-    refine_instruction = st.text_area(
-        "Enter refinement instruction (e.g., make tone more formal, shorten intro):",
-        height=180
-    )
-    apply_refine = st.button("Apply Changes")
+    # Generation inputs live in a form so edits only rerun the script on
+    # submit, not on every field change
+    with st.form("generate_form"):
+        # SEO settings for blog
+        if content_type == "Blog":
+            st.subheader("🔎 SEO Settings")
+            primary_keyword = st.text_input("Primary Keyword")
+            lsi_keywords_input = st.text_input("LSI / Variations (comma-separated)")
+            lsi_keywords = tuple(k.strip() for k in _KEYWORD_SPLIT.split(lsi_keywords_input) if k.strip())
+        else:
+            primary_keyword = ""
+            lsi_keywords = ()
+
+        #st.markdown("<hr style='margin:0; border:0.5px solid #e0e0e0;'>", unsafe_allow_html=True)
+
+        # Generate Button
+        generate_button = st.form_submit_button(f"Generate {content_type}")
+
+    # Refinement Section (same pattern: rerun only on Apply)
+    with st.form("refine_form"):
+        st.markdown("**Refine / Edit generated output**")
+        refine_instruction = st.text_area(
+            "Enter refinement instruction (e.g., make tone more formal, shorten intro):",
+            height=180
+        )
+        apply_refine = st.form_submit_button("Apply Changes")
 
     st.markdown("<hr style='margin:0; border:0.5px solid #e0e0e0;'>", unsafe_allow_html=True)
 
     if st.button("Clear Output"):
         st.session_state.output = ""
         st.session_state.seo_results = {}
+        st.session_state.pop("_retrieval_cache", None)
         st.success("Output cleared.")
 
 # ======================================================
 # Output Section
 # ======================================================
 
-with right:
+# Module-level constant: the same string object every rerun, so Streamlit's
+# element diffing sees an unchanged node instead of a freshly built literal.
+# (A session-state "inject once" guard would not work here - elements that
+# are not re-emitted on a rerun get dropped from the DOM.)
+_OUTPUT_BOX_CSS = """
+    <style>
+    .output-box {
+        border: 2px solid #E0E0E0;
+        border-radius: 12px;
+        padding: 20px;
+        background-color: #F9FAFB;
+        height: 100vh;
+        box-shadow: 0 1px 3px rgba(0,0,0,0.05);
+        overflow-y: auto;
+    }
+    </style>
+"""
+
+@st.fragment
+def _render_output_panel():
+    """Output panel as a fragment: widget changes elsewhere in the app no
+    longer re-execute the markdown conversion and DOM patch of the heaviest
+    element on the page"""
     st.markdown("### 📝 Output")
 
-    st.markdown("""
-        <style>
-        .output-box {
-            border: 2px solid #E0E0E0;
-            border-radius: 12px;
-            padding: 20px;
-            background-color: #F9FAFB;
-            height: 100vh;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-            overflow-y: auto;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_OUTPUT_BOX_CSS, unsafe_allow_html=True)
 
-    if st.session_state.output:
-        clean_output = (
-            st.session_state.output
-            .replace("```markdown", "")
-            .replace("```", "")
-            .lstrip()
-        )
-
-        html_content = markdown.markdown(clean_output)
+    # the box itself lives in a placeholder the generate handler streams
+    # into, so live tokens replace the box in place instead of rendering a
+    # second box a full viewport below the fold
+    slot = st.empty()
+    st.session_state._output_slot = slot
 
-        st.markdown(f"""
+    if st.session_state.output:
+        # skip even the cache lookup when the output hasn't changed since the
+        # last rerun; str objects cache their hash, so this check is O(1) for
+        # the same session-state string
+        output_hash = hash(st.session_state.output)
+        if st.session_state.get("_last_rendered_hash") != output_hash:
+            st.session_state._rendered_html = _render_md(st.session_state.output)
+            st.session_state._last_rendered_hash = output_hash
+
+        slot.markdown(f"""
         <div class='output-box'>
-            {html_content}
+            {st.session_state._rendered_html}
         </div>
         """, unsafe_allow_html=True)
 
     else:
-        st.markdown("<div class='output-box'><em>Generated output will appear here.</em></div>", unsafe_allow_html=True)
+        slot.markdown("<div class='output-box'><em>Generated output will appear here.</em></div>", unsafe_allow_html=True)
+
+
+with right:
+    _render_output_panel()
 
 
 # Services initialization (HANA + Azure)
+# The connection/clients are process-wide singletons via st.cache_resource,
+# so reruns and repeat generations skip the DNS/TLS/auth handshakes.
+
+@st.cache_resource(show_spinner=False)
+def get_hana_conn():
+    from hdbcli import dbapi  # type: ignore
+
+    # one walk through the TOML-backed secrets proxy instead of one per field
+    db_cfg = st.secrets["database"]
+    return dbapi.connect(
+        address=db_cfg["address"],
+        port=db_cfg["port"],
+        user=db_cfg["user"],
+        password=db_cfg["password"],
+        encrypt=True,
+        autocommit=True,
+        sslValidateCertificate=False,
+    )
 
-def init_services():
-    # Check for secrets
-    if "database" in st.secrets and "address" in st.secrets["database"]:
-        st.write("Database secrets found.")
-    else:
-        st.error("Database secrets not found.")
-        raise Exception("Database secrets not found.")
 
-    if "azure" in st.secrets and "openai_endpoint" in st.secrets["azure"]:
-        st.write("Azure secrets found.")
-    else:
-        st.error("Azure secrets not found.")
-        raise Exception("Azure secrets not found.")
+@st.cache_resource(show_spinner=False)
+def get_azure_llm():
+    from openai import AzureOpenAI  # type: ignore
 
-    try:
-        connection = dbapi.connect(
-            address=st.secrets["database"]["address"],
-            port=st.secrets["database"]["port"],
-            user=st.secrets["database"]["user"],
-            password=st.secrets["database"]["password"],
-            encrypt=True,
-            autocommit=True,
-            sslValidateCertificate=False,
-        )
-    except Exception as e:
-        st.error(f"HANA connection error: {e}")
-        raise
+    az_cfg = st.secrets["azure"]
+    return AzureOpenAI(
+        azure_endpoint=az_cfg["openai_endpoint"],
+        api_key=az_cfg["api_key"],
+        api_version=az_cfg["api_version"],
+    )
 
-    try:
-        client = AzureOpenAI(
-            azure_endpoint=st.secrets["azure"]["openai_endpoint"],
-            api_key=st.secrets["azure"]["api_key"],
-            api_version=st.secrets["azure"]["api_version"],
-        )
-    except Exception as e:
-        st.error(f"Azure OpenAI client error: {e}")
-        raise
 
+@st.cache_resource(show_spinner=False)
+def get_embeddings():
+    from langchain_openai import AzureOpenAIEmbeddings  # type: ignore
+
+    az_cfg = st.secrets["azure"]
+    return AzureOpenAIEmbeddings(
+        azure_deployment=az_cfg["embeddings_deployment"],
+        openai_api_version=az_cfg["embeddings_api_version"],
+        api_key=az_cfg["api_key"],
+        azure_endpoint=az_cfg["openai_endpoint"],
+        # batch embed_documents calls: 16 texts per request instead of one
+        chunk_size=16,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_hana_db():
+    from langchain_community.vectorstores.hanavector import HanaDB  # type: ignore
+    from langchain_community.vectorstores.utils import DistanceStrategy  # type: ignore
+
+    # Cosine, made explicit rather than left to the library default. It is
+    # the right metric here: text-embedding-ada-002 output is unit-length.
+    #
+    # Index note: HanaDB issues flat scans. Once the corpus grows past a few
+    # 100k rows, ops should add a quantized ANN index on the table, e.g.
+    #   CREATE HNSW VECTOR INDEX content_vec_idx
+    #     ON MARKETING_APP_CONTENT_GENERATION (VEC_VECTOR)
+    #     SIMILARITY FUNCTION COSINE_SIMILARITY;
+    # (or an IVF-PQ variant where the HANA release supports it) - DDL is an
+    # operational change, deliberately not run from app startup.
+    return HanaDB(
+        embedding=get_embeddings(),
+        connection=get_hana_conn(),
+        distance_strategy=DistanceStrategy.COSINE,
+        table_name="MARKETING_APP_CONTENT_GENERATION",
+        dimension=1536,
+    )
+
+
+def init_services():
+    """Build the (db, client) pair from the cached getters. Deliberately NOT
+    cached itself: the liveness check below has to run on every call so a
+    HANA connection dropped server-side (idle timeout) is rebuilt instead of
+    handed out dead. The call sites report failures, so no UI writes here."""
+    # Check for secrets
     try:
-        embeddings = AzureOpenAIEmbeddings(
-            azure_deployment=st.secrets["azure"]["embeddings_deployment"],
-            openai_api_version=st.secrets["azure"]["embeddings_api_version"],
-            api_key=st.secrets["azure"]["api_key"],
-            azure_endpoint=st.secrets["azure"]["openai_endpoint"],
-        )
-    except Exception as e:
-        st.error(f"Azure Embeddings client error: {e}")
-        raise
+        st.secrets["database"]["address"]
+    except KeyError:
+        raise Exception("Database secrets not found.")
 
     try:
-        db = HanaDB(
-            embedding=embeddings,
-            connection=connection,
-            table_name="MARKETING_APP_CONTENT_GENERATION",
-            dimension=1536,
-        )
-    except Exception as e:
-        st.error(f"HanaDB init error: {e}")
-        raise
+        st.secrets["azure"]["openai_endpoint"]
+    except KeyError:
+        raise Exception("Azure secrets not found.")
 
-    return db, client
+    connection = get_hana_conn()
+    if not connection.isconnected():
+        # rebuild both the connection and the HanaDB wrapping the dead handle
+        get_hana_conn.clear()
+        get_hana_db.clear()
+
+    return get_hana_db(), get_azure_llm()
 
 # Retrieval / RAG logic (fixed hana_text initialization)
 
-def retrieve_content(query, uploaded_files, url_list, db):
-    """Retrieve content from uploaded files, URLs, HANA, or Perplexity fallback"""
-    # 1) Uploaded files
+def retrieve_content(query, uploaded_files, url_list, db_factory):
+    """Retrieve content from uploaded files, URLs, HANA, or Perplexity fallback.
+
+    db_factory is a zero-arg callable producing the HanaDB store; it is only
+    invoked when retrieval falls through to the HANA branch, so generations
+    fed by uploads or URLs (the common case) never touch HANA at all."""
+    # 1) Uploaded files (parsed in parallel; extraction is I/O/CPU-bound per
+    # file). Duplicate uploads are dropped up front by content hash - hashing
+    # is memory-bandwidth cheap versus re-parsing, and it keeps the same
+    # document from appearing twice in the prompt.
     uploaded_text = ""
     if uploaded_files:
+        unique_files = []
+        seen = set()
         for f in uploaded_files:
-            uploaded_text += extract_text_from_file(f) + "\n"
+            if f.size > MAX_UPLOAD_BYTES:
+                if f.name.lower().endswith(".pdf"):
+                    st.warning(f"{f.name} is over {MAX_UPLOAD_BYTES // (1024 * 1024)} MB; "
+                               f"only the first {MAX_PDF_PAGES} pages will be used.")
+                else:
+                    st.warning(f"{f.name} is over {MAX_UPLOAD_BYTES // (1024 * 1024)} MB and was skipped.")
+                    continue
+            digest = hashlib.blake2b(f.getvalue(), digest_size=16).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                unique_files.append(f)
+        if unique_files:
+            with ThreadPoolExecutor(max_workers=min(8, len(unique_files))) as pool:
+                uploaded_text = "\n".join(pool.map(extract_text_from_file, unique_files))
     if uploaded_text.strip():
         return uploaded_text.strip()
 
-    # 2) URLs
+    # 2) URLs (fetched concurrently; network latency dominates here).
+    # The Perplexity fallback for the query is dispatched alongside the URL
+    # fetches, so if the URLs yield nothing we don't pay its latency serially.
+    # No `with` block here: the context manager's shutdown(wait=True) would
+    # block a successful URL fetch on the speculative Perplexity call.
     url_text = ""
+    p_future = None
     if url_list:
-        for url in url_list:
-            url_text += extract_text_from_url(url) + "\n"
-    if url_text.strip():
-        return url_text.strip()
-
-    # 3) HANA similarity search
+        pool = ThreadPoolExecutor(max_workers=min(8, len(url_list) + 1))
+        p_future = pool.submit(perplexity_search, query)
+        url_text = "\n".join(pool.map(extract_text_from_url, url_list))
+        if url_text.strip():
+            # the URLs delivered: return now; the unneeded Perplexity call is
+            # cancelled if still queued, or finishes in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+            return url_text.strip()
+        # URLs came back empty - keep p_future alive for the fallback branch
+        pool.shutdown(wait=False)
+
+    # 3) HANA similarity search (db materialized lazily, only on this branch).
+    # Skipped for queries under 3 words: they embed close to the corpus mean
+    # and match nothing useful, so the embedding round-trip and vector scan
+    # would be pure waste.
     hana_text = ""
     try:
-        docs = db.similarity_search(query, k=20) if db is not None else []
+        if db_factory is not None and len(query.split()) >= 3:
+            db = db_factory()
+            docs = db.similarity_search(query, k=20) if db is not None else []
+        else:
+            docs = []
         # docs may be list of Document-like objects
         if docs:
             hana_text = "\n".join([getattr(doc, "page_content", str(doc)) for doc in docs])
@@ -445,9 +733,9 @@ def retrieve_content(query, uploaded_files, url_list, db):
     if hana_text.strip():
         return hana_text.strip()
 
-    # 4) Fallback: Perplexity search of the query
+    # 4) Fallback: Perplexity search of the query (may already be in flight)
     try:
-        p_text = perplexity_search(query)
+        p_text = p_future.result() if p_future is not None else perplexity_search(query)
         if p_text and not p_text.lower().startswith("perplexity api error"):
             return p_text
     except Exception:
@@ -457,74 +745,75 @@ def retrieve_content(query, uploaded_files, url_list, db):
 
 # Prompt generators (your original, slightly condensed)
 
+# Read-only guideline tables, built once at import and frozen so nothing can
+# mutate them at runtime
+_TONE_GUIDELINES = types.MappingProxyType({
+    "Professional": "Use clear, concise, and confident language. Focus on credibility, precision, and business relevance.",
+    "Friendly": "Use warm, conversational, and easy-to-understand language. Maintain professionalism but sound approachable.",
+    "Authoritative": "Use confident, expert-driven language. Provide strong arguments and data-backed insights.",
+    "Playful": "Use witty, light-hearted, and creative phrasing. Keep the tone fun yet informative, with clever transitions.",
+    "Inspirational": "Use motivational and uplifting language. Focus on positive change, growth, and vision-driven storytelling.",
+    "Conversational": "Write as if speaking naturally to the reader. Use a relaxed and engaging tone with simple, flowing sentences.",
+    "Casual": "Keep the language light, informal, and easy to follow. Avoid jargon; use contractions and relatable examples.",
+    "Semi-casual": "Balance professionalism with friendliness. Use polite, natural phrasing that feels human but credible.",
+    "Business professional": "Maintain a formal, respectful tone suitable for executive audiences. Emphasize clarity, accuracy, and authority.",
+    "Approachable": "Use inclusive and welcoming language. Avoid overly technical terms; sound supportive and open to dialogue.",
+    "Informative": "Focus on clarity and explanation. Use structured, factual sentences that educate the reader efficiently.",
+    "Assertive": "Use confident, decisive language. Clearly express opinions or recommendations without sounding aggressive.",
+    "Engaging": "Use dynamic, audience-focused language. Vary rhythm, include questions, and keep readers emotionally connected.",
+    "First person usage + Visionary (for Thought Leadership Articles)": "Use 'I' or 'we' statements to express personal experience and vision. Inspire forward-thinking perspectives and leadership insights.",
+    "Confident": "Use strong, assured language with active voice. Present ideas as well-founded and impactful.",
+    "Data-driven": "Use factual, analytical language supported by evidence and statistics. Focus on insights, accuracy, and quantifiable outcomes.",
+    "Plainspoken or direct": "Be concise, honest, and transparent. Avoid buzzwords and fluff; prioritize clarity and directness.",
+    "Witty (a bit of humour for special cases)": "Add subtle humor or clever turns of phrase. Keep it tasteful, intelligent, and contextually relevant.",
+    "Storytelling": "Use narrative-driven language with emotional pull. Build flow with characters, challenges, and resolutions to keep readers immersed."
+})
+
+_AUDIENCE_GUIDELINES = types.MappingProxyType({
+    "Senior Management": (
+        "Focus on strategic insights, ROI, and business impact. Use concise, high-level language. Avoid unnecessary technical details."
+    ),
+    "Middle Management": (
+        "Provide actionable guidance, practical steps, and process-oriented insights. Balance strategic context with implementation advice."
+    ),
+    "Junior/Entry Level Staff": (
+        "Explain clearly, use simple examples, and avoid jargon. Focus on learning, awareness, and foundational concepts."
+    ),
+})
+
+
+@functools.lru_cache(maxsize=256)
 def generate_prompt_guidelines(tone, target_audience):
-    tone_guidelines = {
-        "Professional": "Use clear, concise, and confident language. Focus on credibility, precision, and business relevance.",
-        "Friendly": "Use warm, conversational, and easy-to-understand language. Maintain professionalism but sound approachable.",
-        "Authoritative": "Use confident, expert-driven language. Provide strong arguments and data-backed insights.",
-        "Playful": "Use witty, light-hearted, and creative phrasing. Keep the tone fun yet informative, with clever transitions.",
-        "Inspirational": "Use motivational and uplifting language. Focus on positive change, growth, and vision-driven storytelling.",
-        "Conversational": "Write as if speaking naturally to the reader. Use a relaxed and engaging tone with simple, flowing sentences.",
-        "Casual": "Keep the language light, informal, and easy to follow. Avoid jargon; use contractions and relatable examples.",
-        "Semi-casual": "Balance professionalism with friendliness. Use polite, natural phrasing that feels human but credible.",
-        "Business professional": "Maintain a formal, respectful tone suitable for executive audiences. Emphasize clarity, accuracy, and authority.",
-        "Approachable": "Use inclusive and welcoming language. Avoid overly technical terms; sound supportive and open to dialogue.",
-        "Informative": "Focus on clarity and explanation. Use structured, factual sentences that educate the reader efficiently.",
-        "Assertive": "Use confident, decisive language. Clearly express opinions or recommendations without sounding aggressive.",
-        "Authoritative": "Adopt an expert voice with data-backed reasoning. Establish trust through precision and confidence.",
-        "Engaging": "Use dynamic, audience-focused language. Vary rhythm, include questions, and keep readers emotionally connected.",
-        "First person usage + Visionary (for Thought Leadership Articles)": "Use 'I' or 'we' statements to express personal experience and vision. Inspire forward-thinking perspectives and leadership insights.",
-        "Confident": "Use strong, assured language with active voice. Present ideas as well-founded and impactful.",
-        "Data-driven": "Use factual, analytical language supported by evidence and statistics. Focus on insights, accuracy, and quantifiable outcomes.",
-        "Plainspoken or direct": "Be concise, honest, and transparent. Avoid buzzwords and fluff; prioritize clarity and directness.",
-        "Witty (a bit of humour for special cases)": "Add subtle humor or clever turns of phrase. Keep it tasteful, intelligent, and contextually relevant.",
-        "Storytelling": "Use narrative-driven language with emotional pull. Build flow with characters, challenges, and resolutions to keep readers immersed."
-    }
-    audience_guidelines = {
-        "Senior Management": (
-            "Focus on strategic insights, ROI, and business impact. Use concise, high-level language. Avoid unnecessary technical details."
-        ),
-        "Middle Management": (
-            "Provide actionable guidance, practical steps, and process-oriented insights. Balance strategic context with implementation advice."
-        ),
-        "Junior/Entry Level Staff": (
-            "Explain clearly, use simple examples, and avoid jargon. Focus on learning, awareness, and foundational concepts."
-        ),
-    }
-    tone_instruction = tone_guidelines.get(tone, "")
-    audience_instruction = audience_guidelines.get(target_audience, "")
-    return tone_instruction, audience_instruction
+    # tone/audience come from bounded selectboxes, so this fills quickly and
+    # is pure hits across rerun storms
+    return _TONE_GUIDELINES.get(tone, ""), _AUDIENCE_GUIDELINES.get(target_audience, "")
+
+_WORD_RE = re.compile(r"\S+")
+
 
 def enforce_word_limit(text, limit):
     """Trim text to exact word limit. Keeps first `limit` words."""
     if not limit or limit <= 0:
-     return text
-    words = text.split()
-    if len(words) <= limit:
-     return text
-    trimmed = " ".join(words[:limit])
+        return text
+    # single scan over the string: find where word number `limit` starts and
+    # slice there, instead of materializing the full word list twice
+    cut = -1
+    for i, match in enumerate(_WORD_RE.finditer(text)):
+        if i == limit:
+            cut = match.start()
+            break
+    if cut < 0:
+        return text
+    trimmed = text[:cut].rstrip()
     # ensure it ends gracefully
     if not trimmed.endswith((".", "!", "?")):
-     trimmed = trimmed.rstrip(',;:') + '.'
+        trimmed = trimmed.rstrip(',;:') + '.'
     return trimmed
-       
 
-def generate_blog_prompt(tone, target_audience, industry, query, word_limit, final_content,
-                         primary_keyword, lsi_keywords, cta_text):
-    tone_instruction, audience_instruction = generate_prompt_guidelines(tone, target_audience)
-    
-    # Strict word limits instruction
-    if word_limit:
-        lower = max( max(1, word_limit - 20), 1 )
-        upper = word_limit + 20
-        word_limit_instruction = (
-        f"The final blog MUST be between {lower} and {upper} words. "
-        f"Do NOT exceed this range. Stop immediately once you reach the word limit."
-        )
-    else:
-        word_limit_instruction = ""
 
-    return f"""
+# Static prompt skeletons, interned once at import; per-call work is just the
+# substitution of the variable parts via str.format_map.
+_BLOG_TEMPLATE = """
 You are an experienced B2B blog writer specializing in SAP, AI, and enterprise technology domains.
 Your goal is to create a marketing-grade, SEO-optimized, structured, and natural blog aligned with
 enterprise communication standards. Follow these exact rules:
@@ -583,7 +872,7 @@ enterprise communication standards. Follow these exact rules:
 =====================================================
 - Primary Keyword: "{primary_keyword}"
   • Use in Title, Intro (first 100 words), at least one H2, and 2–3 times in the body.
-- LSI Keywords: {', '.join(lsi_keywords) or 'none'}
+- LSI Keywords: {lsi_joined}
   • Include naturally where relevant, never stuffed.
 - Optimize for readability and human tone — not keyword density.
 - Use Markdown headings (##, ###) for structure.
@@ -591,12 +880,12 @@ enterprise communication standards. Follow these exact rules:
 =====================================================
 🧱 CONTENT CONTEXT
 =====================================================
-Industry: {industry or "Enterprise / B2B"}
+Industry: {industry_label}
 Word Limit: ~{word_limit} words
 Topic: "{query}"
 
 REFERENCE CONTENT:
-{final_content or '[No reference content provided]'}
+{reference_content}
 
 =====================================================
 💡 FINAL INSTRUCTION
@@ -615,15 +904,44 @@ Ensure:
 
 """
 
-def generate_video_prompt(tone, target_audience, industry, final_content,cta_text,query, time_limit):
+
+def generate_blog_prompt(tone, target_audience, industry, query, word_limit, final_content,
+                         primary_keyword, lsi_keywords, cta_text):
     tone_instruction, audience_instruction = generate_prompt_guidelines(tone, target_audience)
-    # Approx. 15 seconds per scene → 4 scenes per minute
-    scenes = max(4, int(time_limit * 4))
-    scene_duration = int((time_limit * 60) / scenes)
-    return f"""
-    
+
+    # Strict word limits instruction
+    if word_limit:
+        lower = max( max(1, word_limit - 20), 1 )
+        upper = word_limit + 20
+        word_limit_instruction = (
+        f"The final blog MUST be between {lower} and {upper} words. "
+        f"Do NOT exceed this range. Stop immediately once you reach the word limit."
+        )
+    else:
+        word_limit_instruction = ""
+
+    # joined once up front; also keeps the template mapping free of
+    # expressions that would silently exhaust a generator argument
+    lsi_joined = ", ".join(lsi_keywords) if lsi_keywords else "none"
+
+    return _BLOG_TEMPLATE.format_map({
+        "tone_instruction": tone_instruction,
+        "audience_instruction": audience_instruction,
+        "primary_keyword": primary_keyword,
+        "lsi_joined": lsi_joined,
+        "industry_label": industry or "Enterprise / B2B",
+        "word_limit": word_limit,
+        "query": query,
+        "reference_content": final_content or "[No reference content provided]",
+        "cta_text": cta_text,
+        "word_limit_instruction": word_limit_instruction,
+    })
+
+
+_VIDEO_TEMPLATE = """
+
 You are a professional **B2B video scriptwriter** who creates powerful marketing narratives.
-Write a **timestamp-based video script** for the topic: "{query}" in the {industry or "enterprise"} industry.
+Write a **timestamp-based video script** for the topic: "{query}" in the {industry_label} industry.
 
 =====================================================
 🎬 STRUCTURE
@@ -670,40 +988,89 @@ start each section in new line
 =====================================================
 📚 CONTEXT & REFERENCE
 =====================================================
-Industry: {industry or "Not specified"}
+Industry: {industry_context}
 Topic: "{query}"
 Reference Content:
-{final_content or "[No reference material provided]"}
+{reference_content}
 
 =====================================================
 💡 OUTPUT FORMAT (Example)
 =====================================================
 Return only the **final timestamped script** like this:
 
-0:00–0:{scene_duration:02d} → [Scene 1: Problem introduction narration and visuals]  
-0:{scene_duration:02d}–0:{scene_duration*2:02d} → [Scene 2: Brand introduction narration and visuals]  
+0:00–0:{scene_duration:02d} → [Scene 1: Problem introduction narration and visuals]
+0:{scene_duration:02d}–0:{scene_duration_2:02d} → [Scene 2: Brand introduction narration and visuals]
 
 """
 
-# CTA mapping
 
-cta_mapping = {
-    "Book Assessment": "Book your free SAP Clean Core Assessment today.",
-    "Request a demo": "Request a demo to see the solution in action.",
-    "Talk to our experts": "Talk to our experts to discuss your requirements.",
-    "Learn more about our solutions": "Learn more about our solutions tailored to your needs.",
-    "Contact us today": "Contact us today to get started.",
-    "Download the full guide": "Download the full guide to explore more insights.",
-    "Book a free consultation": "Book your free consultation today.",
-}
+def generate_video_prompt(tone, target_audience, industry, final_content,cta_text,query, time_limit):
+    tone_instruction, audience_instruction = generate_prompt_guidelines(tone, target_audience)
+    # Approx. 15 seconds per scene → 4 scenes per minute
+    scenes = max(4, int(time_limit * 4))
+    scene_duration = int((time_limit * 60) / scenes)
+    return _VIDEO_TEMPLATE.format_map({
+        "tone_instruction": tone_instruction,
+        "audience_instruction": audience_instruction,
+        "query": query,
+        "industry_label": industry or "enterprise",
+        "industry_context": industry or "Not specified",
+        "reference_content": final_content or "[No reference material provided]",
+        "cta_text": cta_text,
+        "time_limit": time_limit,
+        "scenes": scenes,
+        "scene_duration": scene_duration,
+        "scene_duration_2": scene_duration * 2,
+    })
+
 
 # Generate / Refine Handlers
 
-def call_openai_chat(client, prompt_system, max_tokens=3200, temperature=0.7):
+def stream_openai_chat(client, messages, max_tokens=3200, temperature=0.7):
+    """Stream an Azure OpenAI chat completion over a messages list, yielding
+    content deltas"""
+    response = client.chat.completions.create(messages=messages, model="Codetest", max_tokens=max_tokens, temperature=temperature, stream=True)
+    for chunk in response:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+
+def call_openai_chat(client, messages, max_tokens=3200, temperature=0.7):
     """Call Azure OpenAI chat completion and return content or raise"""
-    messages = [{"role": "system", "content": prompt_system}]
-    response = client.chat.completions.create(messages=messages, model="Codetest", max_tokens=max_tokens, temperature=temperature)
-    return response.choices[0].message.content
+    return "".join(stream_openai_chat(client, messages, max_tokens, temperature))
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _refine_output(_client, history):
+    """Memoized refinement: the cache key is the full conversation including
+    the instruction turn, so repeating the same instruction on the same
+    output returns instantly without an Azure round-trip"""
+    return call_openai_chat(_client, history, max_tokens=3000)
+
+
+def stream_to_placeholder(token_iter, placeholder):
+    """Render streamed deltas into `placeholder` incrementally. Completed
+    markdown blocks (separated by blank lines) are converted once through the
+    _render_md cache; the trailing open block is re-converted per update via
+    the uncached _convert_md, since each growing partial is unique and would
+    only churn the _render_md LRU. Returns the full accumulated text."""
+    buf = []
+    rendered = []  # HTML of completed blocks
+    tail = ""      # markdown of the current open block
+    for delta in token_iter:
+        if not delta:
+            continue
+        buf.append(delta)
+        tail += delta
+        if "\n\n" in tail:
+            *complete, tail = tail.split("\n\n")
+            rendered.extend(_render_md(block) for block in complete)
+        placeholder.markdown(
+            "<div class='output-box'>" + "".join(rendered)
+            + _convert_md(_FENCE_RE.sub("", tail).lstrip()) + "</div>",
+            unsafe_allow_html=True,
+        )
+    return "".join(buf)
 
 
 if generate_button and query:
@@ -712,22 +1079,44 @@ if generate_button and query:
         st.error("For Blog generation, Primary Keyword is required.")
     else:
         with st.spinner(f"Generating {content_type}..."):
+            # Only the LLM client is needed up front; HANA is initialized
+            # lazily inside retrieve_content, and only when the retrieval
+            # actually reaches the similarity-search branch.
             try:
-                db, client = init_services()
-                if not db or not client:
+                client = get_azure_llm()
+                if not client:
                     raise Exception("Failed to initialize one or more services.")
             except Exception as e:
                 st.error(f"Service init error: {e}")
-                db, client = None, None
                 st.stop()  # Stop execution if services fail
 
+            def _get_db():
+                return init_services()[0]
+
             # Build full query (topic + additional)
             full_query = query.strip()
 
-            final_content = retrieve_content(full_query, uploaded_files, url_list, db)
+            # Write-through cache in session state: regenerating with the same
+            # topic/files/URLs (e.g. after a tone or CTA tweak) skips the whole
+            # retrieval pass
+            retrieval_key = hashlib.blake2b(
+                "\n".join(
+                    [full_query]
+                    + sorted(hashlib.blake2b(f.getvalue(), digest_size=16).hexdigest()
+                             for f in (uploaded_files or []))
+                    + url_list
+                ).encode("utf-8"),
+                digest_size=16,
+            ).hexdigest()
+            retrieval_cache = st.session_state.setdefault("_retrieval_cache", {})
+            if retrieval_key in retrieval_cache:
+                final_content = retrieval_cache[retrieval_key]
+            else:
+                final_content = retrieve_content(full_query, uploaded_files, url_list, _get_db)
+                retrieval_cache[retrieval_key] = final_content
 
             # Prepare CTA text
-            cta_text = cta_mapping.get(cta_choice, cta_choice)
+            cta_text = CTA_MAPPING[cta_choice]
 
             # Build prompt
             if content_type == "Blog":
@@ -736,8 +1125,17 @@ if generate_button and query:
             else:
                 prompt = generate_video_prompt(tone, target_audience, industry, final_content, cta_text, query, time_limit)
 
+            messages = [{"role": "system", "content": prompt}]
+
             try:
-                output = call_openai_chat(client, prompt)
+                # stream tokens into the output panel's own placeholder so the
+                # live text replaces the box in place; the rerun below
+                # re-renders the final text through the cached path
+                slot = st.session_state.get("_output_slot")
+                if slot is None:
+                    with right:
+                        slot = st.empty()
+                output = stream_to_placeholder(stream_openai_chat(client, messages), slot)
             except Exception as e:
                 st.error(f"OpenAI API error: {e}")
                 output = ""
@@ -745,6 +1143,9 @@ if generate_button and query:
             if output:
                 st.session_state.output = output
                 st.session_state.last_prompt = full_query
+                # keep the conversation so refinements send only the delta
+                # instruction instead of re-embedding the output in a prompt
+                st.session_state.chat_history = messages + [{"role": "assistant", "content": output}]
 
                 # Run SEO checks if blog
                 if content_type == "Blog":
@@ -757,25 +1158,44 @@ if generate_button and query:
 
 # Apply refine
 if apply_refine and st.session_state.output and refine_instruction and refine_instruction.strip():
+    # fast-exit: re-submitting the instruction that was just applied would
+    # only burn an identical Azure round-trip
+    refine_key = hash((st.session_state.output, refine_instruction.strip().lower()))
+    if st.session_state.get("_last_refine_key") == refine_key:
+        st.info("This refinement has already been applied.")
+        st.stop()
+
     with st.spinner("Applying refinement..."):
+        # refinement only talks to the LLM; no HANA needed
         try:
-            db, client = init_services()
-            if not db or not client:
+            client = get_azure_llm()
+            if not client:
                 raise Exception("Failed to initialize one or more services.")
         except Exception as e:
             st.error(f"Service init error: {e}")
-            db, client = None, None
             st.stop()  # Stop execution if services fail
 
-        refine_prompt = f"Refine the following content based on instruction: '{refine_instruction.strip()}'\n\nContent:\n{st.session_state.output}"
+        # multi-turn refinement: the prior turns are resent as-is (a stable
+        # prefix eligible for server-side prompt caching) and only the
+        # instruction is new input, instead of pasting the whole output into
+        # a fresh flat prompt
+        history = st.session_state.get("chat_history") or [
+            {"role": "assistant", "content": st.session_state.output}
+        ]
+        history = history + [{
+            "role": "user",
+            "content": f"Refine the content based on instruction: '{refine_instruction.strip()}'",
+        }]
         try:
-            new_output = call_openai_chat(client, refine_prompt, max_tokens=3000)
+            new_output = _refine_output(client, history)
         except Exception as e:
             st.error(f"Refinement error: {e}")
             new_output = ""
 
         if new_output:
             st.session_state.output = new_output
+            st.session_state.chat_history = history + [{"role": "assistant", "content": new_output}]
+            st.session_state._last_refine_key = refine_key
             # Re-run SEO validation if blog
             if content_type == "Blog":
                 #seo_results = seo_check(new_output, primary_keyword.strip(), lsi_keywords)